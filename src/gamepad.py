@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pi-Bot Gamepad Bridge
+Drives pi-bot from a USB gamepad by reading Linux evdev events and sending
+track speeds to the web controller over a persistent HTTP connection
+"""
+
+import argparse
+import fcntl
+import http.client
+import json
+import os
+import socket
+import struct
+import time
+
+# struct input_event from <linux/input.h>: timeval, type, code, value
+EVENT_FORMAT = 'llHHi'
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
+ABS_X = 0x00
+ABS_Y = 0x01
+ABS_RX = 0x03
+ABS_RY = 0x04
+
+BTN_SOUTH = 0x130   # A / Cross - stop
+
+
+def unpack_event(data, offset=0):
+    """Decode one struct input_event into (timestamp, type, code, value)"""
+    sec, usec, etype, code, value = struct.unpack_from(EVENT_FORMAT, data, offset)
+    return sec + usec / 1e6, etype, code, value
+
+
+def EVIOCGABS(axis):
+    """ioctl request number for reading struct input_absinfo of an axis"""
+    size = struct.calcsize('6i')
+    return (2 << 30) | (size << 16) | (ord('E') << 8) | (0x40 + axis)
+
+
+class EvdevSource:
+    """Reads events from a /dev/input/event* device with blocking reads"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def _absinfo(self, axis):
+        """struct input_absinfo (value, min, max, fuzz, flat, resolution) or None"""
+        buf = bytearray(struct.calcsize('6i'))
+        try:
+            fcntl.ioctl(self.fd, EVIOCGABS(axis), buf)
+        except OSError:
+            return None
+        return struct.unpack('6i', buf)
+
+    def axis_range(self, axis, default):
+        """Return (min, max) reported by the device for an axis"""
+        info = self._absinfo(axis)
+        if info is None:
+            return default
+        _, minimum, maximum, _, _, _ = info
+        return (minimum, maximum) if maximum > minimum else default
+
+    def axis_value(self, axis):
+        """Current position of an axis, or None if it can't be read"""
+        info = self._absinfo(axis)
+        return info[0] if info else None
+
+    def batches(self):
+        """
+        Yield lists of (timestamp, type, code, value), blocking until input
+        arrives. Each list is everything one read returned, so events that
+        queued up while a command was being sent come back together.
+        """
+        while True:
+            data = os.read(self.fd, EVENT_SIZE * 64)
+            if not data:
+                return
+            yield [unpack_event(data, offset)
+                   for offset in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE)]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ReplaySource:
+    """
+    Replays a raw evdev capture for testing without a gamepad
+    Record one with: cat /dev/input/event0 > capture.bin
+    """
+
+    def __init__(self, path, realtime=False):
+        self.path = path
+        self.realtime = realtime
+
+    def axis_range(self, axis, default):
+        return default
+
+    def axis_value(self, axis):
+        return None
+
+    def batches(self):
+        """
+        Yield recorded events in lists like EvdevSource. A realtime replay
+        yields one report at a time, paced by its original timestamp;
+        otherwise events come back in read-sized lists as fast as possible.
+        """
+        start = None
+        batch = []
+        with open(self.path, 'rb') as f:
+            while True:
+                data = f.read(EVENT_SIZE)
+                if len(data) < EVENT_SIZE:
+                    break
+                event = unpack_event(data)
+                if self.realtime and not batch:
+                    now = time.monotonic()
+                    if start is None:
+                        start = (now, event[0])
+                    delay = (event[0] - start[1]) - (now - start[0])
+                    if delay > 0:
+                        time.sleep(delay)
+                batch.append(event)
+                if self.realtime:
+                    done = event[1] == EV_SYN and event[2] == SYN_REPORT
+                else:
+                    done = len(batch) == 64
+                if done:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        pass
+
+
+def normalize(value, axis_range):
+    """Map a raw axis value onto -1.0 to 1.0"""
+    minimum, maximum = axis_range
+    centre = (minimum + maximum) / 2.0
+    half = (maximum - minimum) / 2.0
+    return max(-1.0, min(1.0, (value - centre) / half))
+
+
+def shape(value, deadzone, expo):
+    """
+    Apply a deadzone and expo curve to a normalized axis
+    deadzone: fraction of travel ignored around the centre
+    expo: 0.0 (linear) to 1.0 (fully cubic) for finer control near centre
+    """
+    magnitude = abs(value)
+    if magnitude <= deadzone:
+        return 0.0
+    magnitude = (magnitude - deadzone) / (1.0 - deadzone)
+    magnitude = (1.0 - expo) * magnitude + expo * magnitude ** 3
+    return magnitude if value > 0 else -magnitude
+
+
+def mix_arcade(throttle, steer):
+    """Single stick: throttle and steering to (left, right) in -1.0 to 1.0"""
+    left = throttle + steer
+    right = throttle - steer
+    scale = max(1.0, abs(left), abs(right))
+    return left / scale, right / scale
+
+
+class PiBotLink:
+    """Persistent HTTP connection to the pi-bot control API"""
+
+    def __init__(self, host, port, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def _connect(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.conn.connect()
+        self.conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def post(self, payload, path='/api/control'):
+        """POST a JSON request, reconnecting once if the link dropped"""
+        body = json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json'}
+        for attempt in range(2):
+            try:
+                if self.conn is None:
+                    self._connect()
+                self.conn.request('POST', path, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return json.loads(data)
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class GamepadBridge:
+    """Turns gamepad state into track speeds and sends them on meaningful change"""
+
+    def __init__(self, source, link, client='gamepad', mode='arcade', deadzone=0.08, expo=0.4,
+                 max_speed=100, threshold=3, axis_range=(-32768, 32767), verbose=False):
+        self.source = source
+        self.link = link
+        self.client = client
+        self.mode = mode
+        self.deadzone = deadzone
+        self.expo = expo
+        self.max_speed = max_speed
+        self.threshold = threshold
+        self.verbose = verbose
+        self.axes = {}
+        self.ranges = {}
+        for axis in (ABS_X, ABS_Y, ABS_RX, ABS_RY):
+            self.ranges[axis] = source.axis_range(axis, axis_range)
+        self.sent = (0, 0)
+        self.dirty = False
+        self.dropped = False
+
+    def axis(self, code):
+        raw = self.axes.get(code)
+        if raw is None:
+            return 0.0
+        return shape(normalize(raw, self.ranges[code]), self.deadzone, self.expo)
+
+    def speeds(self):
+        """Current (left, right) track speeds from the stick positions"""
+        if self.mode == 'tank':
+            left, right = -self.axis(ABS_Y), -self.axis(ABS_RY)
+        else:
+            left, right = mix_arcade(-self.axis(ABS_Y), self.axis(ABS_X))
+        return round(left * self.max_speed), round(right * self.max_speed)
+
+    def changed(self, speeds):
+        """True when speeds differ enough from what was last sent"""
+        for new, old in zip(speeds, self.sent):
+            if (new == 0) != (old == 0) or (new > 0) != (old > 0):
+                return True
+            if abs(new - old) >= self.threshold:
+                return True
+        return False
+
+    def send(self, speeds, received=None, release=True):
+        """
+        Send track speeds. A stop from the sticks returning to centre is a
+        release, which the server ignores unless this bridge is driving;
+        release=False is an explicit stop that always applies.
+        """
+        left, right = speeds
+        if left == 0 and right == 0:
+            command = {'action': 'stop', 'client': self.client}
+            if release:
+                command['release'] = True
+        else:
+            command = {'action': 'tracks', 'left': left, 'right': right, 'client': self.client}
+        try:
+            reply = self.link.post(command)
+        except (OSError, http.client.HTTPException) as e:
+            # Link is down - keep running so the next report retries
+            print(f"pi-bot: connection error: {e}")
+            return
+        if reply.get('status') != 'ok':
+            # Not sent (e.g. another controller holds the lease) - retry on the next report
+            print(f"pi-bot: {reply.get('message')}")
+            return
+        self.sent = speeds
+        if self.verbose:
+            latency = f" ({(time.perf_counter() - received) * 1000:.1f}ms)" if received else ""
+            print(f"left {left:4d}  right {right:4d}{latency}")
+
+    def take_control(self):
+        """Take the driver lease from whoever holds it"""
+        self.link.post({'client': self.client, 'takeover': True}, path='/api/lease')
+
+    def resync(self):
+        """Re-read every axis after the kernel dropped events"""
+        for axis in self.ranges:
+            value = self.source.axis_value(axis)
+            if value is not None:
+                self.axes[axis] = value
+        self.dirty = True
+
+    def handle(self, batch, received=None):
+        """
+        Apply a batch of events and send once with the final stick state,
+        so reports that queued up during a slow request are never sent stale
+        """
+        report = False
+        for _, etype, code, value in batch:
+            if etype == EV_SYN and code == SYN_DROPPED:
+                # Kernel buffer overran - ignore everything up to the next report
+                self.dropped = True
+            elif etype == EV_SYN and code == SYN_REPORT:
+                if self.dropped:
+                    self.dropped = False
+                    self.resync()
+                report = report or self.dirty
+            elif self.dropped:
+                continue
+            elif etype == EV_ABS:
+                self.axes[code] = value
+                self.dirty = True
+            elif etype == EV_KEY and code == BTN_SOUTH and value == 1:
+                self.send((0, 0), received, release=False)
+
+        if report:
+            self.dirty = False
+            speeds = self.speeds()
+            if self.changed(speeds):
+                self.send(speeds, received)
+
+    def run(self):
+        for batch in self.source.batches():
+            self.handle(batch, time.perf_counter())
+
+
+def main():
+    """Bridge a gamepad to pi-bot"""
+    parser = argparse.ArgumentParser(description="Drive pi-bot from a USB gamepad")
+    parser.add_argument('--device', default='/dev/input/event0', help="evdev device to read")
+    parser.add_argument('--replay', help="raw evdev capture to replay instead of a device")
+    parser.add_argument('--realtime', action='store_true', help="replay with original timing")
+    parser.add_argument('--host', default='192.168.4.1', help="pi-bot address")
+    parser.add_argument('--port', type=int, default=5000, help="pi-bot web port")
+    parser.add_argument('--client', default=f'gamepad-{socket.gethostname()}',
+                        help="name used for the driver lease")
+    parser.add_argument('--takeover', action='store_true', help="take control from the current driver")
+    parser.add_argument('--mode', choices=['arcade', 'tank'], default='arcade',
+                        help="arcade: left stick drives and steers; tank: one stick per track")
+    parser.add_argument('--deadzone', type=float, default=0.08, help="stick deadzone (0-1)")
+    parser.add_argument('--expo', type=float, default=0.4, help="expo curve (0-1)")
+    parser.add_argument('--max-speed', type=int, default=100, help="speed at full stick (%%)")
+    parser.add_argument('--threshold', type=int, default=3, help="minimum change to send (%%)")
+    parser.add_argument('--axis-min', type=int, default=-32768, help="axis minimum for replays")
+    parser.add_argument('--axis-max', type=int, default=32767, help="axis maximum for replays")
+    parser.add_argument('--verbose', action='store_true', help="print every command sent")
+    args = parser.parse_args()
+
+    if args.replay:
+        source = ReplaySource(args.replay, realtime=args.realtime)
+    else:
+        source = EvdevSource(args.device)
+    link = PiBotLink(args.host, args.port)
+    bridge = GamepadBridge(
+        source, link,
+        client=args.client,
+        mode=args.mode,
+        deadzone=args.deadzone,
+        expo=args.expo,
+        max_speed=args.max_speed,
+        threshold=args.threshold,
+        axis_range=(args.axis_min, args.axis_max),
+        verbose=args.verbose,
+    )
+
+    print(f"Bridging {args.replay or args.device} to http://{args.host}:{args.port} ({args.mode} mode)")
+    print("Press Ctrl+C to stop")
+
+    try:
+        if args.takeover:
+            bridge.take_control()
+        bridge.run()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        # However the bridge ends (replay done, gamepad unplugged, Ctrl+C), leave
+        # the robot stopped - send() only logs if the link is down
+        bridge.send((0, 0))
+        source.close()
+        link.close()
+
+
+if __name__ == "__main__":
+    main()
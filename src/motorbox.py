@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pi-Bot Motor Mailbox
+Shared-memory handoff of track speeds between the web server and motord
+"""
+
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from pibot import TankDrive
+
+MAILBOX_SIZE = 4096
+
+# Each block is guarded by a sequence counter (seqlock): the writer makes it
+# odd while updating and even when done, and a reader retries if it saw an
+# odd value or the counter moved while it was reading.
+SEQ_FORMAT = '<I'
+
+# Written by the web server: left, right, left multiplier, right multiplier
+COMMAND_OFFSET = 0
+COMMAND_FORMAT = '<4d'
+
+# Written by motord: last command sequence applied, heartbeat time,
+# battery voltage, battery current (NaN when not measured), duty limit
+STATUS_OFFSET = 256
+STATUS_FORMAT = '<I4d'
+
+
+class MotorMailbox:
+    """
+    Fixed-size mmap shared by one writer and one reader per block
+
+    Reads and writes go straight into the mapped file with struct.pack_into
+    and unpack_from, so no copies or cross-process locks are involved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o660)
+        try:
+            if os.fstat(fd).st_size < MAILBOX_SIZE:
+                os.ftruncate(fd, MAILBOX_SIZE)
+            self.mm = mmap.mmap(fd, MAILBOX_SIZE)
+        finally:
+            os.close(fd)
+        # Serializes writer threads within this process only
+        self._write_lock = threading.Lock()
+
+    def _write(self, offset, fmt, *values):
+        with self._write_lock:
+            seq = struct.unpack_from(SEQ_FORMAT, self.mm, offset)[0]
+            # Next odd value (write in progress), skipping past one left odd by a crashed writer
+            seq = (seq + (2 if seq & 1 else 1)) & 0xffffffff
+            struct.pack_into(SEQ_FORMAT, self.mm, offset, seq)
+            struct.pack_into(fmt, self.mm, offset + 8, *values)
+            struct.pack_into(SEQ_FORMAT, self.mm, offset, (seq + 1) & 0xffffffff)
+            return (seq + 1) & 0xffffffff
+
+    def _read(self, offset, fmt, retries=100):
+        for _ in range(retries):
+            before = struct.unpack_from(SEQ_FORMAT, self.mm, offset)[0]
+            if before & 1:
+                continue
+            values = struct.unpack_from(fmt, self.mm, offset + 8)
+            if struct.unpack_from(SEQ_FORMAT, self.mm, offset)[0] == before:
+                return before, values
+        return None
+
+    def write_command(self, left, right, left_multiplier, right_multiplier):
+        """Publish target track speeds, returns the new sequence number"""
+        return self._write(COMMAND_OFFSET, COMMAND_FORMAT,
+                           left, right, left_multiplier, right_multiplier)
+
+    def read_command(self):
+        """Return (seq, (left, right, left_multiplier, right_multiplier)) or None"""
+        return self._read(COMMAND_OFFSET, COMMAND_FORMAT)
+
+    def command_seq(self):
+        return struct.unpack_from(SEQ_FORMAT, self.mm, COMMAND_OFFSET)[0]
+
+    def write_status(self, applied, voltage=math.nan, current=math.nan, max_duty=100):
+        """Report the last applied command and battery state, refreshing the heartbeat"""
+        self._write(STATUS_OFFSET, STATUS_FORMAT, applied, time.time(), voltage, current, max_duty)
+
+    def read_status(self):
+        """Return (applied seq, heartbeat time, voltage, current, max duty) or None"""
+        status = self._read(STATUS_OFFSET, STATUS_FORMAT)
+        return status[1] if status else None
+
+    def close(self):
+        self.mm.close()
+
+
+class RemoteTankBot(TankDrive):
+    """
+    TankBot stand-in that forwards commands to motord through the mailbox
+    Has the same movement API, but never touches GPIO itself.
+    """
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        command = mailbox.read_command()
+        if command and command[0]:
+            self.left_speed, self.right_speed, self.left_multiplier, self.right_multiplier = command[1]
+        else:
+            self.left_speed = self.right_speed = 0.0
+            self.left_multiplier = self.right_multiplier = 1.0
+        print(f"RemoteTankBot using mailbox {mailbox.path}")
+
+    def _publish(self):
+        self.mailbox.write_command(self.left_speed, self.right_speed,
+                                   self.left_multiplier, self.right_multiplier)
+
+    def set_multipliers(self, left=None, right=None):
+        """Set track speed multipliers for calibration"""
+        if left is not None:
+            self.left_multiplier = max(0.0, min(1.0, left))
+        if right is not None:
+            self.right_multiplier = max(0.0, min(1.0, right))
+        self._publish()
+
+    def set_left_track(self, speed):
+        self.left_speed = speed
+        self._publish()
+
+    def set_right_track(self, speed):
+        self.right_speed = speed
+        self._publish()
+
+    def set_tracks(self, left, right):
+        """Set both tracks in a single mailbox update"""
+        self.left_speed = left
+        self.right_speed = right
+        self._publish()
+
+    def battery(self):
+        """Battery readings and duty limit reported by motord"""
+        status = self.mailbox.read_status()
+        if not status:
+            return {'voltage': None, 'current': None, 'max_duty': None}
+        _, _, voltage, current, max_duty = status
+        return {
+            'voltage': None if math.isnan(voltage) else round(voltage, 3),
+            'current': None if math.isnan(current) else round(current, 3),
+            'max_duty': max_duty,
+        }
+
+    def daemon_alive(self, timeout=2.0):
+        """True if motord has refreshed its heartbeat within timeout seconds"""
+        status = self.mailbox.read_status()
+        return bool(status) and time.time() - status[1] < timeout
+
+    def cleanup(self):
+        """Stop the tracks - GPIO itself stays with motord"""
+        self.stop()
+        self.mailbox.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pi-Bot Motor Daemon
+Owns the GPIO pins and applies track speeds published in the motor mailbox,
+so motor timing and cleanup don't depend on the web server
+"""
+
+from pibot import TankBot
+from motorbox import MotorMailbox
+from sensors import battery_sampler_from_env
+from dotenv import load_dotenv
+import signal
+import time
+import os
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configuration from environment
+MOTOR_MAILBOX = os.getenv('MOTOR_MAILBOX', '/dev/shm/pibot-motor')
+MOTOR_POLL_MS = float(os.getenv('MOTOR_POLL_MS', 2))
+REVERSE_DELAY_MS = int(os.getenv('REVERSE_DELAY_MS', 100))
+REVERSE_MODE = os.getenv('REVERSE_MODE', 'brake').lower()
+
+HEARTBEAT_INTERVAL = 0.5
+
+
+def run(bot, mailbox, poll_interval, should_run=lambda: True, sampler=None):
+    """Apply each new mailbox command to bot until should_run() is False"""
+    def write_status():
+        if sampler:
+            mailbox.write_status(applied, sampler.voltage, sampler.current, bot.max_duty)
+        else:
+            mailbox.write_status(applied, max_duty=bot.max_duty)
+
+    # Whatever is in the mailbox now was meant for a previous daemon - don't replay it
+    applied = mailbox.command_seq()
+    write_status()
+    heartbeat = time.monotonic()
+
+    while should_run():
+        command = mailbox.read_command()
+        if command and command[0] != applied:
+            applied, (left, right, left_multiplier, right_multiplier) = command
+            bot.set_multipliers(left=left_multiplier, right=right_multiplier)
+            bot.set_tracks(left, right)
+            write_status()
+            heartbeat = time.monotonic()
+        elif time.monotonic() - heartbeat >= HEARTBEAT_INTERVAL:
+            write_status()
+            heartbeat = time.monotonic()
+
+        time.sleep(poll_interval)
+
+
+def main():
+    """Start the motor daemon"""
+    running = True
+
+    def shutdown(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print("Initializing TankBot...")
+    bot = TankBot(reverse_delay=REVERSE_DELAY_MS / 1000.0, reverse_mode=REVERSE_MODE)
+    mailbox = MotorMailbox(MOTOR_MAILBOX)
+    sampler = battery_sampler_from_env(bot)
+    if sampler:
+        sampler.start()
+
+    print("\nPi-Bot Motor Daemon")
+    print("=" * 50)
+    print(f"Mailbox: {MOTOR_MAILBOX}")
+    print(f"Poll interval: {MOTOR_POLL_MS}ms")
+    print(f"Reverse protection: {REVERSE_MODE} for {REVERSE_DELAY_MS}ms")
+    print(f"Battery sensor: {os.getenv('SENSOR_BACKEND', 'none') if sampler else 'none'}")
+    print("=" * 50)
+
+    try:
+        run(bot, mailbox, MOTOR_POLL_MS / 1000.0, lambda: running, sampler)
+    finally:
+        print("\nShutting down...")
+        if sampler:
+            sampler.stop()
+        bot.cleanup()
+        mailbox.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pi-Bot Network Monitor
+Samples Wi-Fi link quality and AP clients from /proc and /sys in the background
+"""
+
+import os
+import threading
+import time
+
+
+class NetworkMonitor:
+    """
+    Periodically reads interface stats and caches the result
+
+    Everything is read from plain files, so no subprocess runs per sample.
+    root prefixes every path, which lets a directory of fixture files stand
+    in for /proc, /sys and /etc when the hardware is absent.
+    """
+
+    def __init__(self, interface='wlan0', interval=5.0, root='/'):
+        self.interface = interface
+        self.interval = interval
+        self.root = root
+        self._previous = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.status = {'interface': interface, 'updated': None}
+
+    def _path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def _read(self, path):
+        try:
+            with open(self._path(path)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _read_int(self, path):
+        text = self._read(path)
+        try:
+            return int(text)
+        except (TypeError, ValueError):
+            return None
+
+    def read_wireless(self):
+        """
+        Link quality, signal (dBm), noise and frames discarded at the retry
+        limit ("Discarded packets: retry") from /proc/net/wireless
+        """
+        text = self._read('/proc/net/wireless')
+        if not text:
+            return {}
+        for line in text.splitlines()[2:]:
+            name, _, fields = line.partition(':')
+            if name.strip() != self.interface:
+                continue
+            values = fields.split()
+            if len(values) < 8:
+                return {}
+            return {
+                'link_quality': float(values[1].rstrip('.')),
+                'signal_dbm': float(values[2].rstrip('.')),
+                'noise_dbm': float(values[3].rstrip('.')),
+                'discarded_retry': int(values[7]),
+            }
+        return {}
+
+    def read_counters(self):
+        """Interface state and traffic counters from /sys/class/net"""
+        base = f'/sys/class/net/{self.interface}'
+        state = self._read(f'{base}/operstate')
+        counters = {'state': state.strip() if state else 'missing'}
+        for name in ('rx_bytes', 'tx_bytes', 'rx_errors', 'tx_errors', 'tx_dropped'):
+            counters[name] = self._read_int(f'{base}/statistics/{name}')
+        return counters
+
+    def read_ap_mode(self):
+        """AP settings written by setup-ap-mode.sh, or None in client mode"""
+        text = self._read('/etc/pibot-ap-mode')
+        if text is None:
+            return None
+        settings = {}
+        for line in text.splitlines():
+            key, sep, value = line.partition('=')
+            if sep:
+                settings[key.strip().lower()] = value.strip()
+        return settings
+
+    def read_clients(self):
+        """Stations reachable on the interface, from the ARP table and DHCP leases"""
+        names = {}
+        leases = self._read('/var/lib/misc/dnsmasq.leases') or ''
+        for line in leases.splitlines():
+            parts = line.split()
+            if len(parts) >= 4:
+                names[parts[1].lower()] = parts[3] if parts[3] != '*' else None
+
+        clients = []
+        arp = self._read('/proc/net/arp') or ''
+        for line in arp.splitlines()[1:]:
+            parts = line.split()
+            # IP, HW type, Flags, HW address, Mask, Device - flag 0x2 is a complete entry
+            if len(parts) >= 6 and parts[5] == self.interface and parts[2] == '0x2':
+                mac = parts[3].lower()
+                clients.append({'ip': parts[0], 'mac': mac, 'name': names.get(mac)})
+        return clients
+
+    def sample(self):
+        """Take one sample, update the cache and return it"""
+        now = time.monotonic()
+        status = {'interface': self.interface, 'updated': time.time()}
+        status.update(self.read_counters())
+        status.update(self.read_wireless())
+        ap = self.read_ap_mode()
+        status['mode'] = 'ap' if ap is not None else 'client'
+        if ap is not None:
+            status['ssid'] = ap.get('ssid')
+            status['ap_ip'] = ap.get('ip')
+        status['clients'] = self.read_clients()
+
+        # Throughput from the change since the previous sample
+        previous = self._previous
+        if previous and now > previous[0]:
+            elapsed = now - previous[0]
+            for counter, rate in (('rx_bytes', 'rx_rate'), ('tx_bytes', 'tx_rate')):
+                # Either counter can be missing (e.g. a partial fixture tree)
+                if status[counter] is not None and previous[1][counter] is not None:
+                    status[rate] = (status[counter] - previous[1][counter]) / elapsed
+        self._previous = (now, status)
+
+        self.status = status
+        return status
+
+    def snapshot(self):
+        """Most recent cached sample"""
+        return self.status
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Network monitor error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start sampling in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="netmon", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
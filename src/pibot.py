@@ -5,7 +5,11 @@ Pi-Bot Tank Robot Controller
 Controls two tank tracks via L298N motor driver
 """
 
+import heapq
+import math
+import threading
 import time
+from array import array
 
 # Try to import RPi.GPIO, fall back to mock for testing on non-Pi systems
 try:
@@ -15,47 +19,338 @@ except (ImportError, RuntimeError):
     print("WARNING: RPi.GPIO not available - using mock GPIO for testing")
     MOCK_GPIO = True
 
-    # Mock GPIO module for testing on non-Pi systems
-    class MockGPIO:
-        BCM = "BCM"
-        OUT = "OUT"
-        HIGH = 1
-        LOW = 0
 
-        @staticmethod
-        def setmode(mode): pass
+class PinTrace:
+    """
+    Compact record of pin transitions
+    Stored as parallel arrays (timestamp, pin, value) so long runs stay small
+    """
 
-        @staticmethod
-        def setwarnings(flag): pass
+    def __init__(self):
+        self.times = array('d')
+        self.pins = array('B')
+        self.values = array('f')
+
+    def append(self, t, pin, value):
+        self.times.append(t)
+        self.pins.append(pin)
+        self.values.append(value)
+
+    def clear(self):
+        del self.times[:]
+        del self.pins[:]
+        del self.values[:]
+
+    def __len__(self):
+        return len(self.times)
+
+    def events(self, pin=None):
+        """Yield (time, pin, value) tuples, optionally for a single pin"""
+        for t, p, v in zip(self.times, self.pins, self.values):
+            if pin is None or p == pin:
+                yield t, p, v
+
+
+class MockMotor:
+    """
+    First-order model of one L298N channel driving a track
+
+    velocity is a fraction of full speed (-1.0 to 1.0) that moves towards
+    the driven target with time constant tau. Braking (both inputs equal
+    with enable on) settles faster than coasting (enable off).
+    """
+
+    def __init__(self, name, en, in_a, in_b, tau=0.15, brake_tau=0.05, coast_tau=0.5):
+        self.name = name
+        self.en = en
+        self.in_a = in_a
+        self.in_b = in_b
+        self.tau = tau
+        self.brake_tau = brake_tau
+        self.coast_tau = coast_tau
+        self.velocity = 0.0
+        self.updated = None
+        self.faults = 0
+
+    def drive(self, pins, duty):
+        """Return (target velocity, time constant, mode) for the current pin state"""
+        a = pins.get(self.in_a, 0)
+        b = pins.get(self.in_b, 0)
+        enable = duty.get(self.en, 100.0 if pins.get(self.en, 0) else 0.0) / 100.0
+
+        if enable <= 0:
+            return 0.0, self.coast_tau, 'coast'
+        if a and not b:
+            return enable, self.tau, 'forward'
+        if b and not a:
+            return -enable, self.tau, 'reverse'
+        if a and b:
+            return 0.0, self.brake_tau, 'illegal'
+        return 0.0, self.brake_tau, 'brake'
+
+    def update(self, now, pins, duty):
+        """Integrate velocity up to now using the current pin state"""
+        if self.updated is not None and now > self.updated:
+            target, tau, _ = self.drive(pins, duty)
+            decay = math.exp(-(now - self.updated) / tau)
+            self.velocity = target + (self.velocity - target) * decay
+        self.updated = now
+
+
+class MockGPIO:
+    """
+    GPIO simulator for testing on non-Pi systems
+
+    Records every pin transition in a PinTrace and models the two L298N
+    channels used by TankBot, so track velocity can be checked off-device.
+    Replace clock with a fake to step time deterministically.
+    """
+
+    BCM = "BCM"
+    OUT = "OUT"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.trace = PinTrace()
+        self.pins = {}
+        self.duty = {}
+        self.motors = {
+            'left': MockMotor('left', en=12, in_a=17, in_b=27),
+            'right': MockMotor('right', en=13, in_a=22, in_b=23),
+        }
+
+    def setmode(self, mode): pass
+
+    def setwarnings(self, flag): pass
+
+    def setup(self, pin, mode):
+        self.pins.setdefault(pin, self.LOW)
+
+    def _change(self, pin, value, store):
+        now = self.clock()
+        for motor in self.motors.values():
+            motor.update(now, self.pins, self.duty)
+        store[pin] = value
+        self.trace.append(now, pin, value)
+        for motor in self.motors.values():
+            if pin in (motor.in_a, motor.in_b) and self.pins.get(motor.in_a) and self.pins.get(motor.in_b):
+                motor.faults += 1
+
+    def output(self, pin, state):
+        state = self.HIGH if state else self.LOW
+        if self.pins.get(pin) != state:
+            self._change(pin, state, self.pins)
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def cleanup(self):
+        for pin in list(self.pins):
+            self.output(pin, self.LOW)
+        for pin in list(self.duty):
+            self._change(pin, 0.0, self.duty)
+        self.duty.clear()
 
-        @staticmethod
-        def setup(pin, mode): pass
+    def PWM(self, pin, freq):
+        return MockPWM(self, pin, freq)
 
-        @staticmethod
-        def output(pin, state): pass
+    def velocity(self, track):
+        """Simulated velocity of a track ('left' or 'right') at the current time"""
+        motor = self.motors[track]
+        motor.update(self.clock(), self.pins, self.duty)
+        return motor.velocity
 
-        @staticmethod
-        def cleanup(): pass
+    def mode(self, track):
+        """Current L298N channel mode: forward, reverse, brake, coast or illegal"""
+        return self.motors[track].drive(self.pins, self.duty)[2]
 
-        class PWM:
-            def __init__(self, pin, freq):
-                self.pin = pin
-                self.freq = freq
-                self.duty = 0
 
-            def start(self, duty):
-                self.duty = duty
+class MockPWM:
+    def __init__(self, gpio, pin, freq):
+        self.gpio = gpio
+        self.pin = pin
+        self.freq = freq
+        self.duty = 0
 
-            def ChangeDutyCycle(self, duty):
-                self.duty = duty
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
 
-            def stop(self):
-                pass
+    def ChangeDutyCycle(self, duty):
+        if duty != self.gpio.duty.get(self.pin):
+            self.gpio._change(self.pin, float(duty), self.gpio.duty)
+        self.duty = duty
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
 
+
+if MOCK_GPIO:
     GPIO = MockGPIO()
 
-class TankBot:
-    def __init__(self):
+class ScheduledCall:
+    """Handle returned by MotorScheduler.call_later"""
+
+    def __init__(self, deadline, func, args):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class MotorScheduler:
+    """
+    Runs delayed motor actions without blocking the caller
+
+    A background thread sleeps on a condition until the next deadline.
+    With threaded=False nothing runs until run_pending() is called, which
+    together with a fake clock makes timing fully deterministic.
+    """
+
+    def __init__(self, clock=time.monotonic, threaded=True):
+        self.clock = clock
+        self._queue = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = threaded
+        self._thread = None
+        if threaded:
+            self._thread = threading.Thread(target=self._run, name="motor-scheduler", daemon=True)
+            self._thread.start()
+
+    def call_later(self, delay, func, *args):
+        """Run func(*args) after delay seconds, returns a cancellable handle"""
+        call = ScheduledCall(self.clock() + delay, func, args)
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._queue, (call.deadline, self._seq, call))
+            self._cond.notify()
+        return call
+
+    def _pop_due(self):
+        """Return (due call or None, seconds until the next call or None)"""
+        while self._queue:
+            deadline, _, call = self._queue[0]
+            if call.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            wait = deadline - self.clock()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self._queue)
+            return call, 0
+        return None, None
+
+    def run_pending(self):
+        """Run every call whose deadline has passed"""
+        while True:
+            with self._cond:
+                call, _ = self._pop_due()
+            if call is None:
+                return
+            call.func(*call.args)
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                call, wait = self._pop_due()
+                if call is None:
+                    self._cond.wait(wait)
+                    continue
+                self._cond.release()
+                try:
+                    call.func(*call.args)
+                except Exception as e:
+                    print(f"Motor scheduler error: {e}")
+                finally:
+                    self._cond.acquire()
+
+    def shutdown(self):
+        """Stop the background thread, dropping anything still queued"""
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+
+class Track:
+    """Pins and direction-change state for one L298N channel"""
+
+    def __init__(self, name, pwm, in_a, in_b):
+        self.name = name
+        self.pwm = pwm
+        self.in_a = in_a
+        self.in_b = in_b
+        self.direction = 0        # Direction currently set on the IN pins
+        self.duty = 0             # Duty cycle currently set on the EN pin
+        self.last_direction = 0   # Direction the motor was last driven in
+        self.released = None      # Clock time the motor stopped being driven
+        self.pending = None       # Speed waiting for the reverse interval to pass
+        self.requested = 0        # Last speed asked for, before the duty limit
+        self.timer = None         # Scheduled call that applies pending
+
+
+class TankDrive:
+    """
+    Movement helpers shared by every tank controller
+    Subclasses provide set_left_track and set_right_track
+    """
+
+    def set_tracks(self, left, right):
+        """Set both track speeds (-100 to 100)"""
+        self.set_left_track(left)
+        self.set_right_track(right)
+
+    def forward(self, speed=50):
+        """Move forward at given speed (0-100)"""
+        self.set_tracks(speed, speed)
+
+    def backward(self, speed=50):
+        """Move backward at given speed (0-100)"""
+        self.set_tracks(-speed, -speed)
+
+    def pivot_left(self, speed=50):
+        """Pivot left - left track backward, right track forward"""
+        self.set_tracks(-speed, speed)
+
+    def pivot_right(self, speed=50):
+        """Pivot right - left track forward, right track backward"""
+        self.set_tracks(speed, -speed)
+
+    def turn_left(self, speed=50):
+        """Turn left - only right track moves forward, left track stopped"""
+        self.set_tracks(0, speed)
+
+    def turn_right(self, speed=50):
+        """Turn right - only left track moves forward, right track stopped"""
+        self.set_tracks(speed, 0)
+
+    def arc_left(self, speed=50):
+        """Arc left by slowing left track"""
+        self.set_tracks(speed * 0.3, speed)
+
+    def arc_right(self, speed=50):
+        """Arc right by slowing right track"""
+        self.set_tracks(speed, speed * 0.3)
+
+    def stop(self):
+        """Stop both tracks"""
+        self.set_tracks(0, 0)
+
+
+class TankBot(TankDrive):
+    def __init__(self, reverse_delay=0.1, reverse_mode='brake', scheduler=None):
+        """
+        reverse_delay: seconds to brake/coast before a track changes direction
+        reverse_mode: 'brake' (short the motor) or 'coast' (disable the channel)
+        scheduler: MotorScheduler used for the delayed reverse (one is started if None)
+        """
         # Pin definitions
         # Left track (Motor A)
         self.ENA = 12   # PWM - speed control
@@ -91,6 +386,20 @@ class TankBot:
         self.left_multiplier = 1.0
         self.right_multiplier = 1.0
 
+        # Duty limit (0 to 100), lowered when the battery sags
+        self.max_duty = 100
+
+        # Direction-change protection
+        if reverse_mode not in ('brake', 'coast'):
+            raise ValueError(f"Unknown reverse mode: {reverse_mode}")
+        self.reverse_delay = max(0.0, reverse_delay)
+        self.reverse_mode = reverse_mode
+        self._own_scheduler = scheduler is None
+        self.scheduler = scheduler or MotorScheduler()
+        self._lock = threading.RLock()
+        self.left = Track('left', self.pwm_left, self.IN1, self.IN2)
+        self.right = Track('right', self.pwm_right, self.IN3, self.IN4)
+
         print("TankBot initialized")
 
     def set_multipliers(self, left=None, right=None):
@@ -100,26 +409,26 @@ class TankBot:
         if right is not None:
             self.right_multiplier = max(0.0, min(1.0, right))
 
+    def set_max_duty(self, limit):
+        """Limit track duty (0-100), re-applying any track that is running"""
+        limit = max(0, min(100, limit))
+        # Called on every battery sample - skip the lock when nothing changes
+        if limit == self.max_duty:
+            return
+        with self._lock:
+            if limit == self.max_duty:
+                return
+            self.max_duty = limit
+            for track in (self.left, self.right):
+                self._set_track(track, track.requested)
+
     def set_left_track(self, speed):
         """
         Set left track speed and direction
         speed: -100 to 100 (negative = backward, positive = forward)
         """
         # Apply multiplier
-        adjusted_speed = speed * self.left_multiplier
-
-        if adjusted_speed > 0:
-            GPIO.output(self.IN1, GPIO.HIGH)
-            GPIO.output(self.IN2, GPIO.LOW)
-            self.pwm_left.ChangeDutyCycle(abs(adjusted_speed))
-        elif adjusted_speed < 0:
-            GPIO.output(self.IN1, GPIO.LOW)
-            GPIO.output(self.IN2, GPIO.HIGH)
-            self.pwm_left.ChangeDutyCycle(abs(adjusted_speed))
-        else:
-            GPIO.output(self.IN1, GPIO.LOW)
-            GPIO.output(self.IN2, GPIO.LOW)
-            self.pwm_left.ChangeDutyCycle(0)
+        self._set_track(self.left, speed * self.left_multiplier)
 
     def set_right_track(self, speed):
         """
@@ -127,69 +436,104 @@ class TankBot:
         speed: -100 to 100 (negative = backward, positive = forward)
         """
         # Apply multiplier
-        adjusted_speed = speed * self.right_multiplier
-
-        if adjusted_speed > 0:
-            GPIO.output(self.IN3, GPIO.HIGH)
-            GPIO.output(self.IN4, GPIO.LOW)
-            self.pwm_right.ChangeDutyCycle(abs(adjusted_speed))
-        elif adjusted_speed < 0:
-            GPIO.output(self.IN3, GPIO.LOW)
-            GPIO.output(self.IN4, GPIO.HIGH)
-            self.pwm_right.ChangeDutyCycle(abs(adjusted_speed))
-        else:
-            GPIO.output(self.IN3, GPIO.LOW)
-            GPIO.output(self.IN4, GPIO.LOW)
-            self.pwm_right.ChangeDutyCycle(0)
-
-    def forward(self, speed=50):
-        """Move forward at given speed (0-100)"""
-        self.set_left_track(speed)
-        self.set_right_track(speed)
-
-    def backward(self, speed=50):
-        """Move backward at given speed (0-100)"""
-        self.set_left_track(-speed)
-        self.set_right_track(-speed)
-
-    def pivot_left(self, speed=50):
-        """Pivot left - left track backward, right track forward"""
-        self.set_left_track(-speed)
-        self.set_right_track(speed)
-
-    def pivot_right(self, speed=50):
-        """Pivot right - left track forward, right track backward"""
-        self.set_left_track(speed)
-        self.set_right_track(-speed)
-
-    def turn_left(self, speed=50):
-        """Turn left - only right track moves forward, left track stopped"""
-        self.set_left_track(0)
-        self.set_right_track(speed)
+        self._set_track(self.right, speed * self.right_multiplier)
 
-    def turn_right(self, speed=50):
-        """Turn right - only left track moves forward, right track stopped"""
-        self.set_left_track(speed)
-        self.set_right_track(0)
-
-    def arc_left(self, speed=50):
-        """Arc left by slowing left track"""
-        self.set_left_track(speed * 0.3)
-        self.set_right_track(speed)
-
-    def arc_right(self, speed=50):
-        """Arc right by slowing right track"""
-        self.set_left_track(speed)
-        self.set_right_track(speed * 0.3)
+    def _set_track(self, track, speed):
+        """
+        Drive a track, braking for reverse_delay before a direction change
 
-    def stop(self):
-        """Stop both tracks"""
-        self.set_left_track(0)
-        self.set_right_track(0)
+        A reversal stores the speed as pending and schedules it instead of
+        sleeping, so the caller returns immediately. Same-direction changes
+        and stops are applied straight away.
+        """
+        with self._lock:
+            track.requested = speed
+            speed = max(-self.max_duty, min(self.max_duty, speed))
+            direction = (speed > 0) - (speed < 0)
+
+            if track.timer is not None:
+                if direction and direction == -track.last_direction:
+                    # Still reversing - the newest speed wins when it finishes
+                    track.pending = speed
+                    return
+                track.timer.cancel()
+                track.timer = None
+                track.pending = None
+
+            if direction and direction == -track.last_direction and self.reverse_delay > 0:
+                now = self.scheduler.clock()
+                if track.direction or track.released is None:
+                    remaining = self.reverse_delay
+                else:
+                    remaining = self.reverse_delay - (now - track.released)
+
+                if remaining > 0:
+                    self._hold(track, now)
+                    track.pending = speed
+
+                    def finish():
+                        # Reads call under the lock, so only after it has been assigned
+                        with self._lock:
+                            self._finish_reverse(track, call)
+
+                    call = track.timer = self.scheduler.call_later(remaining, finish)
+                    return
+
+            self._apply(track, speed)
+
+    def _finish_reverse(self, track, call):
+        with self._lock:
+            # The scheduler may already have popped a call that was cancelled
+            # and replaced since - only the track's current timer may drive it
+            if call.cancelled or track.timer is not call:
+                return
+            speed = track.pending
+            track.timer = None
+            track.pending = None
+            self._apply(track, speed)
+
+    def _hold(self, track, now):
+        """Brake or coast a track while it waits to change direction"""
+        if track.direction:
+            track.released = now
+        if track.duty:
+            track.pwm.ChangeDutyCycle(0)
+        GPIO.output(track.in_a, GPIO.LOW)
+        GPIO.output(track.in_b, GPIO.LOW)
+        track.direction = 0
+        track.duty = 100 if self.reverse_mode == 'brake' else 0
+        if track.duty:
+            # Enable high with both inputs low shorts the motor (L298N fast stop)
+            track.pwm.ChangeDutyCycle(track.duty)
+
+    def _apply(self, track, speed):
+        """Write direction and duty for a track"""
+        direction = (speed > 0) - (speed < 0)
+        duty = abs(speed)
+
+        if direction != track.direction or (direction == 0 and track.duty):
+            # Drop the enable before touching the inputs so the bridge never
+            # sees a new direction at the old duty
+            if track.duty:
+                track.pwm.ChangeDutyCycle(0)
+                track.duty = 0
+            GPIO.output(track.in_a, GPIO.HIGH if direction > 0 else GPIO.LOW)
+            GPIO.output(track.in_b, GPIO.HIGH if direction < 0 else GPIO.LOW)
+            if track.direction and not direction:
+                track.released = self.scheduler.clock()
+            track.direction = direction
+
+        if direction:
+            track.last_direction = direction
+        if duty != track.duty:
+            track.pwm.ChangeDutyCycle(duty)
+            track.duty = duty
 
     def cleanup(self):
         """Cleanup GPIO"""
         self.stop()
+        if self._own_scheduler:
+            self.scheduler.shutdown()
         self.pwm_left.stop()
         self.pwm_right.stop()
         GPIO.cleanup()
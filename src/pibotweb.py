@@ -5,9 +5,14 @@ Pi-Bot Web Controller
 Web interface for controlling tank robot via L298N motor driver
 """
 
-from flask import Flask, render_template_string, jsonify, request
+from flask import Flask, render_template_string, jsonify, request, url_for
+from werkzeug.serving import WSGIRequestHandler
 from pibot import TankBot
+from motorbox import MotorMailbox, RemoteTankBot
+from netmon import NetworkMonitor
+from sensors import battery_sampler_from_env
 from dotenv import load_dotenv
+import hashlib
 import threading
 import time
 import os
@@ -22,238 +27,106 @@ DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 MIN_SPEED = int(os.getenv('MIN_SPEED', 30))
 MAX_SPEED = int(os.getenv('MAX_SPEED', 100))
 DEFAULT_SPEED = int(os.getenv('DEFAULT_SPEED', 60))
+REVERSE_DELAY_MS = int(os.getenv('REVERSE_DELAY_MS', 100))
+REVERSE_MODE = os.getenv('REVERSE_MODE', 'brake').lower()
+NETWORK_INTERFACE = os.getenv('NETWORK_INTERFACE', 'wlan0')
+NETWORK_INTERVAL = float(os.getenv('NETWORK_INTERVAL', 5))
+NETWORK_ROOT = os.getenv('NETWORK_ROOT', '/')
+LEASE_SECONDS = float(os.getenv('LEASE_SECONDS', 10))
+MOTOR_DAEMON = os.getenv('MOTOR_DAEMON', 'False').lower() == 'true'
+MOTOR_MAILBOX = os.getenv('MOTOR_MAILBOX', '/dev/shm/pibot-motor')
 
 app = Flask(__name__)
 bot = None
+battery = None
 command_lock = threading.Lock()
-
-# HTML template for the control interface
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Pi-Bot Controller</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            background-color: #1a1a1a;
-            color: #fff;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            margin: 0;
-            padding: 20px;
-            box-sizing: border-box;
-        }
-
-        .main-layout {
-            display: flex;
-            align-items: center;
-            gap: 20px;
-        }
-
-        .track-slider {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            padding: 10px;
-            background-color: #333;
-            border-radius: 10px;
-            height: 300px;
-        }
-
-        .track-slider label {
-            font-size: 12px;
-            margin-bottom: 10px;
-            color: #888;
-        }
-
-        .track-slider input[type="range"] {
-            writing-mode: vertical-lr;
-            direction: rtl;
-            height: 200px;
-            width: 30px;
-            cursor: pointer;
-        }
-
-        .track-slider .value {
-            margin-top: 10px;
-            font-size: 14px;
-            color: #4CAF50;
-            font-weight: bold;
-        }
-
-        .container {
-            text-align: center;
-            max-width: 500px;
-            width: 100%;
-        }
-
-        h1 {
-            margin-bottom: 30px;
-            color: #4CAF50;
-        }
-
-        .controls {
-            display: grid;
-            grid-template-columns: repeat(3, 1fr);
-            gap: 10px;
-            max-width: 400px;
-            margin: 0 auto;
-        }
-
-        .btn {
-            background-color: #333;
-            border: 2px solid #4CAF50;
-            color: white;
-            padding: 0;
-            font-size: 18px;
-            cursor: pointer;
-            border-radius: 10px;
-            transition: all 0.1s;
-            user-select: none;
-            -webkit-user-select: none;
-            -moz-user-select: none;
-            aspect-ratio: 1;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            min-height: 80px;
+network = NetworkMonitor(NETWORK_INTERFACE, NETWORK_INTERVAL, NETWORK_ROOT)
+
+
+class DriverLease:
+    """
+    Decides which client may drive
+
+    One client holds a time-limited lease that each of its commands renews.
+    Everyone else is a spectator until the lease expires or they take over.
+    Holder and expiry are kept as one (holder, expires) tuple that is only
+    replaced under a small lock of its own, separate from command_lock, so
+    reads never see a holder paired with someone else's expiry.
+    """
+
+    def __init__(self, duration, clock=time.monotonic):
+        self.duration = duration
+        self.clock = clock
+        self._state = (None, 0.0)
+        self._lock = threading.Lock()
+
+    @property
+    def holder(self):
+        return self._state[0]
+
+    def acquire(self, client, takeover=False):
+        """Claim or renew the lease, returns True if client may drive"""
+        with self._lock:
+            holder, expires = self._state
+            now = self.clock()
+            if takeover or holder is None or holder == client or now >= expires:
+                self._state = (client, now + self.duration)
+                return True
+            return False
+
+    def holds(self, client):
+        """True if client was the last to drive, even if its lease has run out"""
+        return self._state[0] == client
+
+    def release(self, client):
+        """Give up the lease if client holds it"""
+        with self._lock:
+            if self._state[0] == client:
+                self._state = (None, 0.0)
+
+    def state(self, client):
+        """Lease information as seen by client"""
+        holder, expires = self._state
+        remaining = expires - self.clock()
+        active = holder is not None and remaining > 0
+        return {
+            'driver': active and holder == client,
+            'available': not active or holder == client,
+            'expires_in': round(remaining, 1) if active else 0,
         }
 
-        .btn:active {
-            background-color: #4CAF50;
-            transform: scale(0.95);
-        }
 
-        .btn:disabled {
-            opacity: 0.3;
-            cursor: not-allowed;
-        }
+lease = DriverLease(LEASE_SECONDS)
 
-        .btn-forward {
-            grid-column: 2;
-            grid-row: 1;
-        }
 
-        .btn-left {
-            grid-column: 1;
-            grid-row: 2;
-        }
+def client_id(data):
+    """Identify the client sending a request, falling back to its address"""
+    return str(data.get('client') or request.remote_addr)
 
-        .btn-stop {
-            grid-column: 2;
-            grid-row: 2;
-            background-color: #d32f2f;
-            border-color: #f44336;
-        }
+# Static assets are served with a content hash in the URL so browsers can
+# cache them forever and still pick up changes after an update
+STATIC_ASSETS = ('pibot.css', 'pibot.js')
 
-        .btn-stop:active {
-            background-color: #f44336;
-        }
 
-        .btn-right {
-            grid-column: 3;
-            grid-row: 2;
-        }
+def asset_versions():
+    """Short content hash of each static asset"""
+    versions = {}
+    for name in STATIC_ASSETS:
+        with open(os.path.join(app.static_folder, name), 'rb') as f:
+            versions[name] = hashlib.sha256(f.read()).hexdigest()[:12]
+    return versions
 
-        .btn-backward {
-            grid-column: 2;
-            grid-row: 3;
-        }
 
-        .btn-forward-left {
-            grid-column: 1;
-            grid-row: 1;
-        }
+ASSET_VERSIONS = asset_versions()
 
-        .btn-forward-right {
-            grid-column: 3;
-            grid-row: 1;
-        }
-
-        .btn-backward-left {
-            grid-column: 1;
-            grid-row: 3;
-        }
-
-        .btn-backward-right {
-            grid-column: 3;
-            grid-row: 3;
-        }
-
-        .status {
-            margin-top: 30px;
-            padding: 15px;
-            background-color: #333;
-            border-radius: 5px;
-            font-size: 14px;
-        }
-
-        .speed-control {
-            margin-top: 20px;
-            padding: 15px;
-            background-color: #333;
-            border-radius: 5px;
-        }
-
-        .speed-control input {
-            width: 100%;
-            max-width: 300px;
-        }
-
-        .speed-value {
-            color: #4CAF50;
-            font-weight: bold;
-            font-size: 18px;
-        }
-
-        @media (max-width: 600px) {
-            .main-layout {
-                flex-direction: column;
-            }
-
-            .track-sliders-row {
-                display: flex;
-                gap: 20px;
-                order: 1;
-            }
-
-            .track-slider {
-                height: auto;
-                flex-direction: row;
-                padding: 10px 15px;
-            }
-
-            .track-slider input[type="range"] {
-                writing-mode: horizontal-tb;
-                direction: ltr;
-                height: 30px;
-                width: 100px;
-            }
-
-            .track-slider label {
-                margin-bottom: 0;
-                margin-right: 10px;
-            }
-
-            .track-slider .value {
-                margin-top: 0;
-                margin-left: 10px;
-            }
-
-            .btn {
-                font-size: 14px;
-                min-height: 60px;
-            }
-
-            h1 {
-                font-size: 24px;
-            }
-        }
-    </style>
+# HTML template for the control interface
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Pi-Bot Controller</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <link rel="stylesheet" href="{{ url_for('static', filename='pibot.css', v=versions['pibot.css']) }}">
 </head>
 <body>
     <div class="main-layout">
@@ -290,7 +163,12 @@ HTML_TEMPLATE = """
 
             <div class="status">
                 <div>Status: <span id="status">Ready</span></div>
+                <div>Role: <span id="role">-</span> <button id="takeover" class="takeover" hidden>Take control</button></div>
                 <div>Last Command: <span id="lastCommand">None</span></div>
+                <div>Latency: <span id="rtt">-</span></div>
+                <div>Link: <span id="link">-</span></div>
+                <div>Clients: <span id="clients">-</span></div>
+                <div>Battery: <span id="battery">-</span></div>
             </div>
         </div>
 
@@ -302,166 +180,98 @@ HTML_TEMPLATE = """
         </div>
     </div>
 
-    <script>
-        const speedSlider = document.getElementById('speed');
-        const speedValue = document.getElementById('speedValue');
-        const statusEl = document.getElementById('status');
-        const lastCommandEl = document.getElementById('lastCommand');
-        const buttons = document.querySelectorAll('.btn');
-
-        // Track multiplier elements
-        const leftMultiplier = document.getElementById('leftMultiplier');
-        const rightMultiplier = document.getElementById('rightMultiplier');
-        const leftValue = document.getElementById('leftValue');
-        const rightValue = document.getElementById('rightValue');
-
-        // Update speed display
-        speedSlider.addEventListener('input', function() {
-            speedValue.textContent = this.value;
-        });
-
-        // Update multiplier displays and send to server
-        leftMultiplier.addEventListener('input', function() {
-            leftValue.textContent = this.value + '%';
-            updateMultipliers();
-        });
-
-        rightMultiplier.addEventListener('input', function() {
-            rightValue.textContent = this.value + '%';
-            updateMultipliers();
-        });
-
-        function updateMultipliers() {
-            fetch('/api/multiplier', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    left: parseInt(leftMultiplier.value) / 100,
-                    right: parseInt(rightMultiplier.value) / 100
-                })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'ok') {
-                    statusEl.textContent = 'Multipliers updated';
-                    statusEl.style.color = '#4CAF50';
-                }
-            })
-            .catch(error => console.error('Error updating multipliers:', error));
-        }
-
-        // Handle button presses
-        buttons.forEach(button => {
-            // Mouse/touch start
-            button.addEventListener('mousedown', handlePress);
-            button.addEventListener('touchstart', handlePress);
-
-            // Mouse/touch end
-            button.addEventListener('mouseup', handleRelease);
-            button.addEventListener('touchend', handleRelease);
-            button.addEventListener('mouseleave', handleRelease);
-        });
-
-        function handlePress(e) {
-            e.preventDefault();
-            const action = e.currentTarget.dataset.action;
-            const speed = speedSlider.value;
-
-            if (action === 'stop') {
-                sendCommand('stop');
-            } else {
-                sendCommand(action, speed);
-            }
-        }
-
-        function handleRelease(e) {
-            e.preventDefault();
-            const action = e.currentTarget.dataset.action;
-
-            // Don't auto-stop on stop button release
-            if (action !== 'stop') {
-                sendCommand('stop');
-            }
-        }
+    <script src="{{ url_for('static', filename='pibot.js', v=versions['pibot.js']) }}"></script>
+</body>
+</html>
+"""
 
-        function sendCommand(action, speed = 0) {
-            fetch('/api/control', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    action: action,
-                    speed: parseInt(speed)
-                })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'ok') {
-                    statusEl.textContent = 'Connected';
-                    statusEl.style.color = '#4CAF50';
-                    lastCommandEl.textContent = data.command;
-                } else {
-                    statusEl.textContent = 'Error: ' + data.message;
-                    statusEl.style.color = '#f44336';
+# Service worker that serves the controller shell from cache. Only the API
+# goes to the Pi, so the page opens instantly after the first visit
+SW_TEMPLATE = """
+const CACHE = 'pibot-{{ version }}';
+const SHELL = {{ shell | tojson }};
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE)
+        .then(cache => cache.addAll(SHELL))
+        .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    // Drop shells cached by older versions
+    event.waitUntil(
+        caches.keys()
+        .then(keys => Promise.all(keys.filter(key => key !== CACHE).map(key => caches.delete(key))))
+        .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== location.origin || url.pathname.startsWith('/api/')) {
+        return;
+    }
+
+    if (event.request.mode === 'navigate' && url.pathname === '/') {
+        // Serve the cached page at once and refresh it in the background
+        event.respondWith(caches.open(CACHE).then(cache =>
+            cache.match('/').then(cached => {
+                const fresh = fetch(event.request).then(response => {
+                    if (response.ok) cache.put('/', response.clone());
+                    return response;
+                });
+                if (cached) {
+                    event.waitUntil(fresh.catch(() => null));
+                    return cached;
                 }
+                return fresh;
             })
-            .catch(error => {
-                statusEl.textContent = 'Connection Error';
-                statusEl.style.color = '#f44336';
-                console.error('Error:', error);
-            });
-        }
-
-        // Keyboard controls
-        const keyMap = {
-            'w': 'forward',
-            'ArrowUp': 'forward',
-            's': 'backward',
-            'ArrowDown': 'backward',
-            'a': 'left',
-            'ArrowLeft': 'left',
-            'd': 'right',
-            'ArrowRight': 'right',
-            'q': 'forward-left',
-            'e': 'forward-right',
-            'z': 'backward-left',
-            'c': 'backward-right',
-            ' ': 'stop'
-        };
-
-        const activeKeys = new Set();
-
-        document.addEventListener('keydown', (e) => {
-            if (keyMap[e.key] && !activeKeys.has(e.key)) {
-                activeKeys.add(e.key);
-                const speed = speedSlider.value;
-                sendCommand(keyMap[e.key], speed);
-            }
-        });
-
-        document.addEventListener('keyup', (e) => {
-            if (keyMap[e.key]) {
-                activeKeys.delete(e.key);
-                if (e.key !== ' ') {  // Don't auto-stop on spacebar release
-                    sendCommand('stop');
-                }
-            }
-        });
-    </script>
-</body>
-</html>
+        ));
+        return;
+    }
+
+    event.respondWith(
+        caches.match(event.request).then(cached => cached || fetch(event.request))
+    );
+});
 """
 
 @app.route('/')
 def index():
     """Serve the main control page"""
-    return render_template_string(
+    response = app.make_response(render_template_string(
         HTML_TEMPLATE,
         min_speed=MIN_SPEED,
         max_speed=MAX_SPEED,
-        default_speed=DEFAULT_SPEED
-    )
+        default_speed=DEFAULT_SPEED,
+        versions=ASSET_VERSIONS
+    ))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/sw.js')
+def service_worker():
+    """Serve the service worker from the root so it controls the whole page"""
+    response = app.make_response(render_template_string(
+        SW_TEMPLATE,
+        version=hashlib.sha256(''.join(sorted(ASSET_VERSIONS.values())).encode()).hexdigest()[:12],
+        shell=['/'] + [url_for('static', filename=name, v=ASSET_VERSIONS[name]) for name in STATIC_ASSETS]
+    ))
+    response.headers['Content-Type'] = 'application/javascript'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.after_request
+def cache_static(response):
+    """Versioned static assets never change, so let browsers keep them"""
+    # Only when v is the file's current hash - an old page asking for an old
+    # version gets the new content, which must not be pinned under that URL
+    if (request.endpoint == 'static' and response.status_code == 200
+            and request.args.get('v') == ASSET_VERSIONS.get(request.view_args.get('filename'))):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.route('/api/control', methods=['POST'])
 def control():
@@ -472,8 +282,32 @@ def control():
         data = request.get_json()
         action = data.get('action')
         speed = data.get('speed', 60)
+        client = client_id(data)
+
+        # A stop sent automatically when a button, key or stick is let go
+        # only counts from the driver, so spectators can't stop the robot
+        # just by releasing a refused move
+        if action == 'stop' and data.get('release') and not lease.holds(client):
+            return jsonify({'status': 'ok', 'command': 'Release ignored (not driving)', 'lease': lease.state(client)})
+
+        # An explicit stop is always allowed, everything else needs the driver lease
+        if action != 'stop' and not lease.acquire(client):
+            return jsonify({
+                'status': 'error',
+                'message': 'Another controller is driving',
+                'lease': lease.state(client)
+            }), 409
 
         with command_lock:
+            # A takeover may have happened while we waited for the lock -
+            # its stop must not be followed by our stale move
+            if action != 'stop' and not lease.holds(client):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Another controller took control',
+                    'lease': lease.state(client)
+                }), 409
+
             if action == 'forward':
                 bot.forward(speed)
                 command = f"Forward at {speed}%"
@@ -500,16 +334,21 @@ def control():
 
             elif action == 'backward-left':
                 # Backward while turning left
-                bot.set_left_track(-speed * 0.3)
-                bot.set_right_track(-speed)
+                bot.set_tracks(-speed * 0.3, -speed)
                 command = f"Arc backward-left at {speed}%"
 
             elif action == 'backward-right':
                 # Backward while turning right
-                bot.set_left_track(-speed)
-                bot.set_right_track(-speed * 0.3)
+                bot.set_tracks(-speed, -speed * 0.3)
                 command = f"Arc backward-right at {speed}%"
 
+            elif action == 'tracks':
+                # Direct differential control (used by the gamepad bridge)
+                left = max(-MAX_SPEED, min(MAX_SPEED, data.get('left', 0)))
+                right = max(-MAX_SPEED, min(MAX_SPEED, data.get('right', 0)))
+                bot.set_tracks(left, right)
+                command = f"Tracks left {left}% right {right}%"
+
             elif action == 'stop':
                 bot.stop()
                 command = "Stopped"
@@ -517,7 +356,15 @@ def control():
             else:
                 return jsonify({'status': 'error', 'message': 'Unknown action'}), 400
 
-        return jsonify({'status': 'ok', 'command': command})
+        if MOTOR_DAEMON and not bot.daemon_alive():
+            # Published to the mailbox, but nothing is applying it
+            return jsonify({
+                'status': 'error',
+                'message': 'Motor daemon is not running',
+                'lease': lease.state(client)
+            }), 503
+
+        return jsonify({'status': 'ok', 'command': command, 'lease': lease.state(client)})
 
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -525,7 +372,52 @@ def control():
 @app.route('/api/status', methods=['GET'])
 def status():
     """Get current status"""
-    return jsonify({'status': 'ok', 'message': 'Pi-Bot is ready'})
+    client = client_id(request.args)
+    result = {'status': 'ok', 'message': 'Pi-Bot is ready', 'lease': lease.state(client)}
+    if MOTOR_DAEMON:
+        result['motor_daemon'] = bot.daemon_alive()
+        if not result['motor_daemon']:
+            result['message'] = 'Motor daemon is not running'
+    return jsonify(result)
+
+@app.route('/api/lease', methods=['POST'])
+def driver_lease():
+    """Take over or release the driver lease"""
+    global bot
+
+    try:
+        data = request.get_json()
+        client = client_id(data)
+
+        if data.get('release'):
+            lease.release(client)
+        elif data.get('takeover'):
+            # Change holder and stop together under command_lock, so a command
+            # from the old driver either finishes before the stop or is refused
+            with command_lock:
+                previous = lease.holder
+                lease.acquire(client, takeover=True)
+                if previous != client:
+                    # Don't let the new driver inherit the old driver's motion
+                    bot.stop()
+
+        return jsonify({'status': 'ok', 'lease': lease.state(client)})
+
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/network', methods=['GET'])
+def network_status():
+    """Get cached Wi-Fi link and AP client information"""
+    return jsonify({'status': 'ok', **network.snapshot()})
+
+@app.route('/api/battery', methods=['GET'])
+def battery_status():
+    """Get smoothed battery readings and the current motor duty limit"""
+    if MOTOR_DAEMON:
+        return jsonify({'status': 'ok', **bot.battery()})
+    readings = battery.snapshot() if battery else {'voltage': None, 'current': None}
+    return jsonify({'status': 'ok', **readings, 'max_duty': bot.max_duty})
 
 @app.route('/api/multiplier', methods=['POST'])
 def set_multiplier():
@@ -536,6 +428,14 @@ def set_multiplier():
         data = request.get_json()
         left = data.get('left')
         right = data.get('right')
+        client = client_id(data)
+
+        if not lease.acquire(client):
+            return jsonify({
+                'status': 'error',
+                'message': 'Another controller is driving',
+                'lease': lease.state(client)
+            }), 409
 
         with command_lock:
             bot.set_multipliers(left=left, right=right)
@@ -551,10 +451,19 @@ def set_multiplier():
 
 def main():
     """Start the web server"""
-    global bot
-
-    print("Initializing TankBot...")
-    bot = TankBot()
+    global bot, battery
+
+    if MOTOR_DAEMON:
+        # motord owns the GPIO pins; we only post track speeds to its mailbox
+        print("Connecting to motor daemon...")
+        bot = RemoteTankBot(MotorMailbox(MOTOR_MAILBOX))
+    else:
+        print("Initializing TankBot...")
+        bot = TankBot(reverse_delay=REVERSE_DELAY_MS / 1000.0, reverse_mode=REVERSE_MODE)
+        battery = battery_sampler_from_env(bot)
+        if battery:
+            battery.start()
+    network.start()
 
     print("\nPi-Bot Web Controller")
     print("=" * 50)
@@ -562,15 +471,25 @@ def main():
     print("Access from your browser or phone on the same network")
     print(f"Speed range: {MIN_SPEED}% - {MAX_SPEED}%")
     print(f"Default speed: {DEFAULT_SPEED}%")
+    print(f"Reverse protection: {REVERSE_MODE} for {REVERSE_DELAY_MS}ms")
+    print(f"Driver lease: {LEASE_SECONDS}s")
+    print(f"Motor control: {'motor daemon via ' + MOTOR_MAILBOX if MOTOR_DAEMON else 'in process'}")
     print(f"Debug mode: {DEBUG}")
     print("Press Ctrl+C to stop")
     print("=" * 50)
 
+    # Keep connections open between requests so clients like the gamepad
+    # bridge don't pay a TCP handshake per command
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
     try:
         app.run(host=HOST, port=PORT, debug=DEBUG, threaded=True)
     except KeyboardInterrupt:
         print("\n\nShutting down...")
     finally:
+        network.stop()
+        if battery:
+            battery.stop()
         if bot:
             bot.cleanup()
 
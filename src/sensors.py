@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pi-Bot Sensors
+Battery voltage/current sampling with pluggable ADC readers
+"""
+
+import fcntl
+import math
+import os
+import struct
+import threading
+import time
+
+I2C_SLAVE = 0x0703
+
+
+class FileReader:
+    """
+    Reads "voltage [current]" from a text file
+    Stands in for real hardware: echo "7.4 1.2" > /tmp/battery
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        with open(self.path) as f:
+            values = f.read().split()
+        voltage = float(values[0])
+        current = float(values[1]) if len(values) > 1 else math.nan
+        return voltage, current
+
+
+class IIOReader:
+    """
+    Reads an ADC exposed through the kernel IIO sysfs interface (e.g. ADS1115)
+
+    divider: ratio of the battery voltage divider feeding the ADC input
+    current_channel: optional channel wired to a current sense amplifier,
+    converted with amps_per_volt
+    """
+
+    def __init__(self, device, voltage_channel=0, divider=1.0, current_channel=None, amps_per_volt=1.0):
+        self.divider = divider
+        self.amps_per_volt = amps_per_volt
+        self.voltage = self._open(device, voltage_channel)
+        self.current = self._open(device, current_channel) if current_channel is not None else None
+
+    @staticmethod
+    def _open(device, channel):
+        # Scale (mV per count) is fixed for the life of the device, the raw
+        # value is kept open and re-read from the start on every sample
+        with open(os.path.join(device, f'in_voltage{channel}_scale')) as f:
+            scale = float(f.read()) / 1000.0
+        return open(os.path.join(device, f'in_voltage{channel}_raw'), 'rb', buffering=0), scale
+
+    @staticmethod
+    def _volts(channel):
+        f, scale = channel
+        f.seek(0)
+        return int(f.read()) * scale
+
+    def read(self):
+        voltage = self._volts(self.voltage) * self.divider
+        current = self._volts(self.current) * self.amps_per_volt if self.current else math.nan
+        return voltage, current
+
+
+class INA219Reader:
+    """Reads an INA219 power monitor directly through an I2C character device"""
+
+    def __init__(self, device='/dev/i2c-1', address=0x40, shunt_ohms=0.1):
+        self.shunt_ohms = shunt_ohms
+        self.fd = os.open(device, os.O_RDWR)
+        fcntl.ioctl(self.fd, I2C_SLAVE, address)
+
+    def _register(self, register):
+        os.write(self.fd, bytes([register]))
+        return struct.unpack('>h', os.read(self.fd, 2))[0]
+
+    def read(self):
+        # Bus voltage: bits 15-3 in 4 mV steps, shunt voltage: 10 uV steps
+        voltage = ((self._register(0x02) & 0xffff) >> 3) * 0.004
+        current = self._register(0x01) * 0.00001 / self.shunt_ohms
+        return voltage, current
+
+
+def make_reader(backend, path=None, address=0x40, divider=1.0, shunt_ohms=0.1,
+                current_channel=None, amps_per_volt=1.0):
+    """Create a reader from configuration, or None when sensing is disabled"""
+    if backend in (None, '', 'none'):
+        return None
+    if backend == 'file':
+        return FileReader(path or '/tmp/pibot-battery')
+    if backend == 'iio':
+        return IIOReader(path or '/sys/bus/iio/devices/iio:device0', divider=divider,
+                         current_channel=current_channel, amps_per_volt=amps_per_volt)
+    if backend == 'ina219':
+        return INA219Reader(path or '/dev/i2c-1', address=address, shunt_ohms=shunt_ohms)
+    raise ValueError(f"Unknown sensor backend: {backend}")
+
+
+def derate(voltage, start, cutoff, min_duty, step=5):
+    """
+    Maximum motor duty (%) allowed at a battery voltage
+
+    Full duty above start, falling linearly to min_duty at cutoff, rounded
+    down to step. This is the raw curve - BatteryDerating adds hysteresis.
+    """
+    if math.isnan(voltage) or voltage >= start:
+        return 100
+    if voltage <= cutoff:
+        return min_duty
+    duty = min_duty + (100 - min_duty) * (voltage - cutoff) / (start - cutoff)
+    return max(min_duty, int(duty // step * step))
+
+
+class BatteryDerating:
+    """
+    Duty limit from battery voltage, with hysteresis
+
+    Sag depends on load: lowering the duty lets the voltage recover, which
+    on the raw curve would raise the limit again and bring the sag back.
+    So the limit drops as soon as the voltage calls for it, but only rises
+    once the voltage clears the higher step by margin volts and the limit
+    has held for hold seconds.
+    """
+
+    def __init__(self, start, cutoff, min_duty, margin=0.1, hold=5.0, clock=time.monotonic):
+        self.start = start
+        self.cutoff = cutoff
+        self.min_duty = min_duty
+        self.margin = margin
+        self.hold = hold
+        self.clock = clock
+        self.limit = 100
+        self.changed = -math.inf
+
+    def update(self, voltage):
+        """Feed a smoothed voltage, returns the duty limit to apply"""
+        now = self.clock()
+        target = derate(voltage, self.start, self.cutoff, self.min_duty)
+        if target < self.limit:
+            self.limit = target
+            self.changed = now
+        elif target > self.limit and now - self.changed >= self.hold:
+            raised = derate(voltage - self.margin, self.start, self.cutoff, self.min_duty)
+            if raised > self.limit:
+                self.limit = raised
+                self.changed = now
+        return self.limit
+
+
+class SensorSampler:
+    """
+    Samples a reader at a fixed rate in a background thread
+
+    Readings are smoothed with an exponential moving average and published
+    as a new dict each time, so readers never wait on the sampling thread.
+    on_sample(voltage, current) is called after each successful sample.
+    """
+
+    def __init__(self, reader, rate=10.0, smoothing=0.2, on_sample=None):
+        self.reader = reader
+        self.period = 1.0 / rate
+        self.smoothing = smoothing
+        self.on_sample = on_sample
+        self.samples = 0
+        self.errors = 0
+        self.voltage = math.nan
+        self.current = math.nan
+        self._last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.status = {'voltage': None, 'current': None, 'updated': None, 'samples': 0, 'errors': 0}
+
+    def _smooth(self, previous, value):
+        if math.isnan(previous) or math.isnan(value):
+            return value
+        return previous + self.smoothing * (value - previous)
+
+    def sample(self):
+        """Take one reading, update the smoothed values and return them"""
+        try:
+            voltage, current = self.reader.read()
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            self.errors += 1
+            if self.errors == 1:
+                print(f"Sensor read error: {e}")
+            self.status = dict(self.status, errors=self.errors)
+            return None
+
+        self.samples += 1
+        voltage = self.voltage = self._smooth(self.voltage, voltage)
+        current = self.current = self._smooth(self.current, current)
+        self.status = {
+            'voltage': None if math.isnan(voltage) else round(voltage, 3),
+            'current': None if math.isnan(current) else round(current, 3),
+            'updated': time.time(),
+            'samples': self.samples,
+            'errors': self.errors,
+        }
+        if self.on_sample:
+            self.on_sample(voltage, current)
+        return voltage, current
+
+    def snapshot(self):
+        """Most recent smoothed readings"""
+        return self.status
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                # Anything else (e.g. from on_sample) must not end sampling,
+                # or the duty limit and battery status freeze where they are
+                self.errors += 1
+                self.status = dict(self.status, errors=self.errors)
+                if repr(e) != self._last_error:
+                    print(f"Sensor sampler error: {e}")
+                self._last_error = repr(e)
+            # Schedule against fixed deadlines so the rate doesn't drift
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                deadline = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self):
+        """Start sampling in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sensors", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def battery_sampler_from_env(bot):
+    """
+    Build a battery sampler that derates bot from environment settings
+    Returns None when SENSOR_BACKEND is unset or 'none'.
+    """
+    reader = make_reader(
+        os.getenv('SENSOR_BACKEND', 'none').lower(),
+        path=os.getenv('SENSOR_PATH') or None,
+        address=int(os.getenv('SENSOR_ADDRESS', '0x40'), 0),
+        divider=float(os.getenv('SENSOR_DIVIDER', 1.0)),
+        shunt_ohms=float(os.getenv('SENSOR_SHUNT_OHMS', 0.1)),
+        current_channel=int(os.getenv('SENSOR_CURRENT_CHANNEL')) if os.getenv('SENSOR_CURRENT_CHANNEL') else None,
+        amps_per_volt=float(os.getenv('SENSOR_AMPS_PER_VOLT', 1.0)),
+    )
+    if reader is None:
+        return None
+
+    derating = BatteryDerating(
+        float(os.getenv('BATTERY_DERATE_START', 7.0)),
+        float(os.getenv('BATTERY_DERATE_CUTOFF', 6.4)),
+        int(os.getenv('BATTERY_MIN_DUTY', 40)),
+        margin=float(os.getenv('BATTERY_RECOVER_MARGIN', 0.1)),
+        hold=float(os.getenv('BATTERY_RECOVER_HOLD', 5)),
+    )
+
+    def on_sample(voltage, current):
+        bot.set_max_duty(derating.update(voltage))
+
+    return SensorSampler(
+        reader,
+        rate=float(os.getenv('SENSOR_RATE', 10)),
+        smoothing=float(os.getenv('SENSOR_SMOOTHING', 0.2)),
+        on_sample=on_sample,
+    )
@@ -0,0 +1,379 @@
+const speedSlider = document.getElementById('speed');
+const speedValue = document.getElementById('speedValue');
+const statusEl = document.getElementById('status');
+const lastCommandEl = document.getElementById('lastCommand');
+const buttons = document.querySelectorAll('.btn');
+const roleEl = document.getElementById('role');
+const takeoverBtn = document.getElementById('takeover');
+
+// Identifies this tab to the driver lease - kept across reloads of the same tab
+let clientId = sessionStorage.getItem('pibotClient');
+if (!clientId) {
+    clientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    sessionStorage.setItem('pibotClient', clientId);
+}
+
+// Show whether this tab is driving or spectating
+function updateLease(lease) {
+    if (!lease) return;
+    if (lease.driver) {
+        roleEl.textContent = 'Driver';
+        roleEl.style.color = '#4CAF50';
+    } else if (lease.available) {
+        roleEl.textContent = 'Available';
+        roleEl.style.color = '#fff';
+    } else {
+        roleEl.textContent = 'Spectator (' + Math.ceil(lease.expires_in) + 's)';
+        roleEl.style.color = '#FFC107';
+    }
+    takeoverBtn.hidden = lease.available;
+    document.body.classList.toggle('spectator', !lease.available);
+}
+
+takeoverBtn.addEventListener('click', function() {
+    fetch('/api/lease', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ client: clientId, takeover: true })
+    })
+    .then(response => response.json())
+    .then(data => updateLease(data.lease))
+    .catch(error => console.error('Error taking control:', error));
+});
+
+// Track multiplier elements
+const leftMultiplier = document.getElementById('leftMultiplier');
+const rightMultiplier = document.getElementById('rightMultiplier');
+const leftValue = document.getElementById('leftValue');
+const rightValue = document.getElementById('rightValue');
+
+// Update speed display
+speedSlider.addEventListener('input', function() {
+    speedValue.textContent = this.value;
+});
+
+// Update multiplier displays and send to server
+leftMultiplier.addEventListener('input', function() {
+    leftValue.textContent = this.value + '%';
+    updateMultipliers();
+});
+
+rightMultiplier.addEventListener('input', function() {
+    rightValue.textContent = this.value + '%';
+    updateMultipliers();
+});
+
+function updateMultipliers() {
+    // Goes through the command sender, so dragging a slider sends only
+    // the latest values instead of one request per step
+    pendingMultipliers = {
+        client: clientId,
+        left: parseInt(leftMultiplier.value) / 100,
+        right: parseInt(rightMultiplier.value) / 100
+    };
+    flushCommand();
+}
+
+function showMultipliers(data) {
+    if (data.status === 'ok') {
+        statusEl.textContent = 'Multipliers updated';
+        statusEl.style.color = '#4CAF50';
+    }
+}
+
+// Handle button presses
+buttons.forEach(button => {
+    // Mouse/touch start
+    button.addEventListener('mousedown', handlePress);
+    button.addEventListener('touchstart', handlePress);
+
+    // Mouse/touch end
+    button.addEventListener('mouseup', handleRelease);
+    button.addEventListener('touchend', handleRelease);
+    button.addEventListener('mouseleave', handleRelease);
+});
+
+function handlePress(e) {
+    e.preventDefault();
+    const action = e.currentTarget.dataset.action;
+    const speed = speedSlider.value;
+
+    if (action === 'stop') {
+        sendCommand('stop');
+    } else {
+        sendCommand(action, speed);
+    }
+}
+
+function handleRelease(e) {
+    e.preventDefault();
+    const action = e.currentTarget.dataset.action;
+
+    // Don't auto-stop on stop button release
+    if (action !== 'stop') {
+        releaseStop();
+    }
+}
+
+// Stop sent when a button or key is let go. Only sent if this page started
+// a move, and marked as a release so the server ignores it unless we are the
+// driver - moving the mouse over the buttons never stops someone else's robot
+let moveSent = false;
+
+function releaseStop() {
+    if (moveSent) {
+        sendCommand('stop', 0, true);
+    }
+}
+
+// Abort signal that fires after ms - AbortSignal.timeout() is missing on
+// older phones (Safari before 16, older Android WebViews)
+function timeoutSignal(ms) {
+    const controller = new AbortController();
+    setTimeout(() => controller.abort(), ms);
+    return controller.signal;
+}
+
+// Command sender - at most one request is in flight and a newer
+// command replaces one still waiting, so a slow link never builds up
+// a backlog of stale commands. Multiplier updates wait in their own
+// slot and go out when no drive command is waiting
+const REQUEST_TIMEOUT = 2000;
+let pendingCommand = null;
+let pendingMultipliers = null;
+let inFlight = false;
+let lastDone = 0;
+let flushTimer = null;
+
+function sendCommand(action, speed = 0, release = false) {
+    pendingCommand = { action: action, speed: parseInt(speed), client: clientId };
+    if (release) pendingCommand.release = true;
+    moveSent = action !== 'stop';
+    flushCommand();
+}
+
+function sendInterval() {
+    // Gap left after each response before the next command goes out once
+    // the link slows down, so a congested link gets some idle time
+    return rtt === null || rtt < 50 ? 0 : Math.min(rtt / 2, 250);
+}
+
+function flushCommand() {
+    if ((!pendingCommand && !pendingMultipliers) || inFlight) return;
+
+    const urgent = pendingCommand !== null && pendingCommand.action === 'stop';
+    if (flushTimer) {
+        if (!urgent) return;
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+
+    const wait = lastDone + sendInterval() - performance.now();
+    if (wait > 0 && !urgent) {
+        flushTimer = setTimeout(() => {
+            flushTimer = null;
+            flushCommand();
+        }, wait);
+        return;
+    }
+
+    let url, body, showReply;
+    if (pendingCommand) {
+        url = '/api/control';
+        body = pendingCommand;
+        showReply = showCommand;
+        pendingCommand = null;
+    } else {
+        url = '/api/multiplier';
+        body = pendingMultipliers;
+        showReply = showMultipliers;
+        pendingMultipliers = null;
+    }
+    const started = performance.now();
+
+    const request = fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body),
+        signal: timeoutSignal(REQUEST_TIMEOUT)
+    });
+    // Only mark the slot busy once the request is really on its way
+    inFlight = true;
+
+    request
+    .then(response => response.json())
+    .then(data => {
+        recordRtt(performance.now() - started);
+        updateLease(data.lease);
+        showReply(data);
+    })
+    .catch(error => {
+        recordTimeout(error);
+        statusEl.textContent = 'Connection Error';
+        statusEl.style.color = '#f44336';
+        console.error('Error:', error);
+    })
+    .finally(() => {
+        inFlight = false;
+        lastDone = performance.now();
+        flushCommand();
+    });
+}
+
+function showCommand(data) {
+    if (data.status === 'ok') {
+        statusEl.textContent = 'Connected';
+        statusEl.style.color = '#4CAF50';
+        lastCommandEl.textContent = data.command;
+    } else {
+        statusEl.textContent = 'Error: ' + data.message;
+        statusEl.style.color = '#f44336';
+    }
+}
+
+// Round-trip latency, measured by pinging /api/status and from
+// command responses, smoothed so one slow packet doesn't dominate
+const rttEl = document.getElementById('rtt');
+let rtt = null;
+
+function recordRtt(sample) {
+    rtt = rtt === null ? sample : rtt * 0.7 + sample * 0.3;
+    rttEl.textContent = Math.round(rtt) + ' ms';
+    rttEl.style.color = rtt < 100 ? '#4CAF50' : rtt < 300 ? '#FFC107' : '#f44336';
+}
+
+function recordTimeout(error) {
+    // A request that hit the timeout took at least that long - count it,
+    // or the send interval keeps trusting the last good RTT
+    if (error.name === 'AbortError' || error.name === 'TimeoutError') {
+        recordRtt(REQUEST_TIMEOUT);
+    }
+}
+
+// With MOTOR_DAEMON the server answers even when motord is down, so
+// show that instead of "Connected" while nothing would move
+let daemonDown = false;
+
+function updateDaemon(data) {
+    if (data.motor_daemon === false) {
+        daemonDown = true;
+        statusEl.textContent = 'Error: ' + data.message;
+        statusEl.style.color = '#f44336';
+    } else if (daemonDown) {
+        daemonDown = false;
+        statusEl.textContent = 'Connected';
+        statusEl.style.color = '#4CAF50';
+    }
+}
+
+function ping() {
+    const started = performance.now();
+    fetch('/api/status?client=' + encodeURIComponent(clientId), { cache: 'no-store', signal: timeoutSignal(REQUEST_TIMEOUT) })
+    .then(response => response.json())
+    .then(data => {
+        recordRtt(performance.now() - started);
+        updateLease(data.lease);
+        updateDaemon(data);
+    })
+    .catch(error => {
+        recordTimeout(error);
+        rttEl.textContent = 'timeout';
+        rttEl.style.color = '#f44336';
+    });
+}
+
+ping();
+setInterval(ping, 2000);
+
+// Link quality from the network monitor
+const linkEl = document.getElementById('link');
+const clientsEl = document.getElementById('clients');
+
+function updateNetwork() {
+    fetch('/api/network')
+    .then(response => response.json())
+    .then(data => {
+        const parts = [];
+        if (data.signal_dbm !== undefined) {
+            parts.push(data.signal_dbm + ' dBm');
+            parts.push(data.discarded_retry + ' lost after retries');
+        } else {
+            parts.push(data.state || 'unknown');
+        }
+        linkEl.textContent = parts.join(', ');
+        linkEl.style.color = data.signal_dbm === undefined || data.signal_dbm > -67 ? '#fff' : '#FFC107';
+        clientsEl.textContent = (data.clients || []).length;
+    })
+    .catch(error => console.error('Error reading network status:', error));
+}
+
+updateNetwork();
+setInterval(updateNetwork, 5000);
+
+// Battery voltage and the motor limit applied when it sags
+const batteryEl = document.getElementById('battery');
+
+function updateBattery() {
+    fetch('/api/battery')
+    .then(response => response.json())
+    .then(data => {
+        if (data.voltage === null || data.voltage === undefined) {
+            batteryEl.textContent = 'not measured';
+            batteryEl.style.color = '#888';
+            return;
+        }
+        let text = data.voltage.toFixed(2) + ' V';
+        if (data.current !== null) text += ', ' + data.current.toFixed(2) + ' A';
+        if (data.max_duty < 100) text += ' (limited to ' + data.max_duty + '%)';
+        batteryEl.textContent = text;
+        batteryEl.style.color = data.max_duty < 100 ? '#FFC107' : '#4CAF50';
+    })
+    .catch(error => console.error('Error reading battery status:', error));
+}
+
+updateBattery();
+setInterval(updateBattery, 2000);
+
+// Keyboard controls
+const keyMap = {
+    'w': 'forward',
+    'ArrowUp': 'forward',
+    's': 'backward',
+    'ArrowDown': 'backward',
+    'a': 'left',
+    'ArrowLeft': 'left',
+    'd': 'right',
+    'ArrowRight': 'right',
+    'q': 'forward-left',
+    'e': 'forward-right',
+    'z': 'backward-left',
+    'c': 'backward-right',
+    ' ': 'stop'
+};
+
+const activeKeys = new Set();
+
+document.addEventListener('keydown', (e) => {
+    if (keyMap[e.key] && !activeKeys.has(e.key)) {
+        activeKeys.add(e.key);
+        const speed = speedSlider.value;
+        sendCommand(keyMap[e.key], speed);
+    }
+});
+
+document.addEventListener('keyup', (e) => {
+    if (keyMap[e.key]) {
+        activeKeys.delete(e.key);
+        if (e.key !== ' ') {  // Don't auto-stop on spacebar release
+            releaseStop();
+        }
+    }
+});
+
+// Cache the page for instant loads (needs localhost or HTTPS)
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js')
+    .catch(error => console.error('Service worker not registered:', error));
+}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Gamepad bridge tests - run without a gamepad or a robot
+python3 -m pytest src/test_gamepad.py  (or python3 src/test_gamepad.py)
+"""
+import unittest
+
+import gamepad
+from gamepad import ABS_X, ABS_Y, EV_ABS, EV_KEY, EV_SYN, BTN_SOUTH, SYN_DROPPED, SYN_REPORT
+
+
+class FakeSource:
+    """Event source with fixed axis values for resyncs"""
+
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    def axis_range(self, axis, default):
+        return default
+
+    def axis_value(self, axis):
+        return self.values.get(axis)
+
+
+class FakeLink:
+    """Records posted commands, raising error instead when it is set"""
+
+    def __init__(self):
+        self.posts = []
+        self.error = None
+
+    def post(self, payload, path='/api/control'):
+        if self.error:
+            raise self.error
+        self.posts.append(payload)
+        return {'status': 'ok'}
+
+
+def report(x=0, y=0):
+    return [(0.0, EV_ABS, ABS_X, x), (0.0, EV_ABS, ABS_Y, y), (0.0, EV_SYN, SYN_REPORT, 0)]
+
+
+class GamepadBridgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = FakeSource()
+        self.link = FakeLink()
+        self.bridge = gamepad.GamepadBridge(self.source, self.link, deadzone=0.0, expo=0.0)
+
+    def test_batch_sends_only_final_state(self):
+        batch = []
+        for y in range(0, -32768, -800):
+            batch += report(y=y)
+        self.bridge.handle(batch)
+
+        self.assertEqual(len(self.link.posts), 1)
+        self.assertEqual(self.link.posts[0]['left'], self.bridge.speeds()[0])
+
+    def test_connection_error_is_retried(self):
+        self.link.error = ConnectionResetError()
+        self.bridge.handle(report(y=-32768))
+        self.assertEqual(self.bridge.sent, (0, 0))
+
+        self.link.error = None
+        self.bridge.handle(report(y=-32000))
+        self.assertEqual(self.link.posts[-1]['action'], 'tracks')
+        self.assertNotEqual(self.bridge.sent, (0, 0))
+
+    def test_dropped_events_resync_axes(self):
+        self.source.values = {ABS_X: 0, ABS_Y: -32768}
+        self.bridge.handle([(0.0, EV_ABS, ABS_Y, 0), (0.0, EV_SYN, SYN_DROPPED, 0),
+                            (0.0, EV_ABS, ABS_Y, 20000), (0.0, EV_SYN, SYN_REPORT, 0)])
+
+        self.assertEqual(self.link.posts[-1], {'action': 'tracks', 'left': 100, 'right': 100,
+                                               'client': 'gamepad'})
+
+    def test_stop_button_is_not_a_release(self):
+        self.bridge.handle([(0.0, EV_KEY, BTN_SOUTH, 1)])
+        self.assertEqual(self.link.posts, [{'action': 'stop', 'client': 'gamepad'}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Network monitor tests - read a fixture tree instead of /proc, /sys and /etc
+python3 -m pytest src/test_netmon.py  (or python3 src/test_netmon.py)
+"""
+import os
+import tempfile
+import unittest
+
+from netmon import NetworkMonitor
+
+WIRELESS = """\
+Inter-| sta-|   Quality        |   Discarded packets               | Missed | WE
+ face | tus | link level noise |  nwid  crypt   frag  retry   misc | beacon | 22
+ wlan0: 0000   54.  -56.  -256        0      0      0     12      3        0
+"""
+
+ARP = """\
+IP address       HW type     Flags       HW address            Mask     Device
+192.168.4.20     0x1         0x2         AA:BB:CC:DD:EE:01     *        wlan0
+192.168.4.21     0x1         0x0         aa:bb:cc:dd:ee:02     *        wlan0
+10.0.0.5         0x1         0x2         aa:bb:cc:dd:ee:03     *        eth0
+"""
+
+LEASES = "1792400000 aa:bb:cc:dd:ee:01 192.168.4.20 phone *\n"
+
+
+class NetworkMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.monitor = NetworkMonitor('wlan0', root=self.root.name)
+
+    def write(self, path, text):
+        path = os.path.join(self.root.name, path.lstrip('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def write_counter(self, name, value):
+        self.write(f'/sys/class/net/wlan0/statistics/{name}', f'{value}\n')
+
+    def test_reads_fixture_tree(self):
+        self.write('/proc/net/wireless', WIRELESS)
+        self.write('/proc/net/arp', ARP)
+        self.write('/var/lib/misc/dnsmasq.leases', LEASES)
+        self.write('/etc/pibot-ap-mode', 'SSID=pibot\nIP=192.168.4.1\n')
+        self.write('/sys/class/net/wlan0/operstate', 'up\n')
+        self.write_counter('rx_bytes', 1000)
+        self.write_counter('tx_bytes', 500)
+
+        status = self.monitor.sample()
+        self.assertEqual(status['state'], 'up')
+        self.assertEqual(status['signal_dbm'], -56.0)
+        self.assertEqual(status['discarded_retry'], 12)
+        self.assertEqual(status['mode'], 'ap')
+        self.assertEqual(status['ssid'], 'pibot')
+        self.assertEqual(status['clients'], [{'ip': '192.168.4.20', 'mac': 'aa:bb:cc:dd:ee:01', 'name': 'phone'}])
+        self.assertIsNone(status['tx_errors'])
+
+    def test_rates_skip_missing_counters(self):
+        self.write_counter('rx_bytes', 1000)
+        first = self.monitor.sample()
+        self.assertEqual(first['mode'], 'client')
+        self.assertEqual(first['state'], 'missing')
+
+        self.write_counter('rx_bytes', 3000)
+        self.monitor._previous = (self.monitor._previous[0] - 2.0, self.monitor._previous[1])
+        status = self.monitor.sample()
+        self.assertAlmostEqual(status['rx_rate'], 1000, delta=5)
+        self.assertNotIn('tx_rate', status)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+TankBot direction-change tests - run off-device against MockGPIO
+python3 -m pytest src/test_pibot.py  (or python3 src/test_pibot.py)
+"""
+import unittest
+
+import pibot
+
+
+class FakeClock:
+    """Clock that only moves when advance() is called"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TankBotReverseTest(unittest.TestCase):
+    REVERSE_DELAY = 0.1
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.gpio = pibot.MockGPIO(clock=self.clock)
+        self.saved_gpio = pibot.GPIO
+        pibot.GPIO = self.gpio
+        self.scheduler = pibot.MotorScheduler(clock=self.clock, threaded=False)
+        self.bot = pibot.TankBot(reverse_delay=self.REVERSE_DELAY, scheduler=self.scheduler)
+
+    def tearDown(self):
+        pibot.GPIO = self.saved_gpio
+
+    def step(self, seconds):
+        self.clock.advance(seconds)
+        self.scheduler.run_pending()
+
+    def assertNoFaults(self):
+        for name, motor in self.gpio.motors.items():
+            self.assertEqual(motor.faults, 0, f"{name} motor saw both inputs high")
+
+    def test_reversal_brakes_then_drives(self):
+        self.bot.set_left_track(60)
+        self.assertEqual(self.gpio.mode('left'), 'forward')
+
+        self.bot.set_left_track(-60)
+        self.assertEqual(self.gpio.mode('left'), 'brake')
+
+        self.step(self.REVERSE_DELAY / 2)
+        self.assertEqual(self.gpio.mode('left'), 'brake')
+
+        self.step(self.REVERSE_DELAY)
+        self.assertEqual(self.gpio.mode('left'), 'reverse')
+        self.assertEqual(self.gpio.duty[self.bot.ENA], 60.0)
+        self.assertNoFaults()
+
+    def test_same_direction_only_changes_duty(self):
+        self.bot.set_right_track(40)
+        self.gpio.trace.clear()
+
+        self.bot.set_right_track(80)
+        self.assertEqual(list(self.gpio.trace.events()), [(self.clock.now, self.bot.ENB, 80.0)])
+        self.assertEqual(self.gpio.mode('right'), 'forward')
+        self.assertNoFaults()
+
+    def test_stop_cancels_pending_reversal(self):
+        self.bot.set_left_track(60)
+        self.bot.set_left_track(-60)
+        self.bot.stop()
+        self.gpio.trace.clear()
+
+        # Nothing fires when the old reverse deadline passes
+        self.step(self.REVERSE_DELAY * 2)
+        self.assertEqual(len(self.gpio.trace), 0)
+        self.assertEqual(self.gpio.mode('left'), 'coast')
+        self.assertIsNone(self.bot.left.timer)
+        self.assertEqual(self.bot.left.direction, 0)
+        self.assertNoFaults()
+
+    def test_stale_timer_does_not_skip_brake(self):
+        self.bot.set_left_track(60)
+        self.bot.set_left_track(-60)
+
+        # The scheduler thread has taken the first reversal off its queue,
+        # but the track is driven forward and reversed again before it runs
+        self.clock.advance(self.REVERSE_DELAY * 2)
+        with self.scheduler._cond:
+            stale, _ = self.scheduler._pop_due()
+        self.bot.set_left_track(60)
+        self.bot.set_left_track(-60)
+
+        stale.func(*stale.args)
+        self.assertEqual(self.gpio.mode('left'), 'brake')
+
+        self.step(self.REVERSE_DELAY * 2)
+        self.assertEqual(self.gpio.mode('left'), 'reverse')
+        self.assertNoFaults()
+
+
+if __name__ == "__main__":
+    unittest.main()
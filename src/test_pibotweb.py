@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Driver lease tests - drive the web API against MockGPIO
+python3 -m pytest src/test_pibotweb.py  (or python3 src/test_pibotweb.py)
+"""
+import threading
+import unittest
+
+import pibot
+import pibotweb
+from test_pibot import FakeClock
+
+
+class SignallingLock:
+    """command_lock stand-in that reports when a request starts waiting on it"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        self.waiting.set()
+        self.lock.acquire()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+class DriverLeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.gpio = pibot.MockGPIO(clock=self.clock)
+        saved = (pibot.GPIO, pibotweb.bot, pibotweb.lease, pibotweb.command_lock)
+        self.addCleanup(self.restore, saved)
+        pibot.GPIO = self.gpio
+        pibotweb.bot = pibot.TankBot(scheduler=pibot.MotorScheduler(clock=self.clock, threaded=False))
+        pibotweb.lease = pibotweb.DriverLease(10, clock=self.clock)
+        self.client = pibotweb.app.test_client()
+
+    @staticmethod
+    def restore(saved):
+        pibot.GPIO, pibotweb.bot, pibotweb.lease, pibotweb.command_lock = saved
+
+    def control(self, client, action, **fields):
+        return self.client.post('/api/control', json={'action': action, 'speed': 50, 'client': client, **fields})
+
+    def test_spectator_refused_until_expiry(self):
+        self.assertEqual(self.control('a', 'forward').status_code, 200)
+
+        response = self.control('b', 'left')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.get_json()['lease']['available'])
+        self.assertEqual(self.gpio.mode('left'), 'forward')
+
+        self.clock.advance(11)
+        self.assertEqual(self.control('b', 'left').status_code, 200)
+        self.assertEqual(self.gpio.mode('left'), 'brake')
+
+    def test_release_stop_from_spectator_ignored(self):
+        self.control('a', 'forward')
+
+        response = self.control('b', 'stop', release=True)
+        self.assertEqual(response.get_json()['command'], 'Release ignored (not driving)')
+        self.assertEqual(self.gpio.mode('left'), 'forward')
+
+        # An explicit stop always applies
+        self.control('b', 'stop')
+        self.assertEqual(self.gpio.mode('left'), 'coast')
+
+    def test_takeover_stops_bot(self):
+        self.control('a', 'forward')
+
+        response = self.client.post('/api/lease', json={'client': 'b', 'takeover': True})
+        self.assertTrue(response.get_json()['lease']['driver'])
+        self.assertEqual(self.gpio.mode('left'), 'coast')
+        self.assertEqual(self.control('a', 'forward').status_code, 409)
+
+    def test_takeover_refuses_queued_move(self):
+        self.control('a', 'forward')
+        self.control('a', 'stop')
+
+        # a's move passes the lease check, then waits on command_lock
+        # while b takes over
+        pibotweb.command_lock = lock = SignallingLock()
+        lock.lock.acquire()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(response=self.control('a', 'forward')))
+        thread.start()
+        self.assertTrue(lock.waiting.wait(5))
+        pibotweb.lease.acquire('b', takeover=True)
+        lock.lock.release()
+        thread.join(5)
+
+        self.assertEqual(result['response'].status_code, 409)
+        self.assertEqual(self.gpio.mode('left'), 'coast')
+
+
+if __name__ == "__main__":
+    unittest.main()
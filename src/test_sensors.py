@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Battery derating tests - fed voltages directly, no ADC needed
+python3 -m pytest src/test_sensors.py  (or python3 src/test_sensors.py)
+"""
+import math
+import unittest
+
+from sensors import BatteryDerating, derate
+from test_pibot import FakeClock
+
+START, CUTOFF, MIN_DUTY = 7.0, 6.4, 40
+
+
+class DerateTest(unittest.TestCase):
+
+    def test_curve(self):
+        self.assertEqual(derate(7.2, START, CUTOFF, MIN_DUTY), 100)
+        self.assertEqual(derate(math.nan, START, CUTOFF, MIN_DUTY), 100)
+        self.assertEqual(derate(6.7, START, CUTOFF, MIN_DUTY), 70)
+        self.assertEqual(derate(6.0, START, CUTOFF, MIN_DUTY), MIN_DUTY)
+
+
+class BatteryDeratingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.derating = BatteryDerating(START, CUTOFF, MIN_DUTY, margin=0.1, hold=5.0, clock=self.clock)
+
+    def test_drops_immediately(self):
+        self.assertEqual(self.derating.update(7.2), 100)
+        self.assertEqual(self.derating.update(6.7), 70)
+        self.assertEqual(self.derating.update(6.51), 50)
+
+    def test_no_rise_before_hold(self):
+        self.derating.update(6.7)
+        self.clock.advance(4.9)
+        self.assertEqual(self.derating.update(7.2), 70)
+
+    def test_rise_needs_margin(self):
+        self.derating.update(6.7)
+        self.clock.advance(6)
+
+        # 6.82 is 80% on the raw curve, but 6.72 (less the margin) is still 70%
+        self.assertEqual(self.derating.update(6.82), 70)
+        # 6.9 clears the 80% step by the margin
+        self.assertEqual(self.derating.update(6.9), 80)
+
+        # Each rise restarts the hold
+        self.assertEqual(self.derating.update(7.2), 80)
+        self.clock.advance(6)
+        self.assertEqual(self.derating.update(7.2), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()